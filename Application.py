@@ -4,10 +4,17 @@ import math
 import subprocess
 import sys
 from pathlib import Path
-from typing import List, Dict, Tuple, Set, Any
+from itertools import groupby
+from typing import List, Dict, Tuple, Iterator, Any
 from GeneraGrafici import plot_graphs
-from MySql import mainMySql
+from MySql import mainMySql, QUERIES, PARTITIONED_QUERIES
 from Neo4j import mainNeo4j
+from GraphSnapshot import mainCsr
+from Checkpoint import CHECKPOINT_DIRNAME
+
+# Metadati (ORDER BY / LIMIT) per nome query, usati per scegliere il tipo di confronto
+QUERY_META = {q["name"]: q for q in QUERIES + PARTITIONED_QUERIES}
+
 
 def _to_number_or_str(v: str) -> Any:
     """Prova a convertire in int/float; altrimenti stringa invariata."""
@@ -30,26 +37,26 @@ def _to_number_or_str(v: str) -> Any:
         return s
 
 
-def load_table(path: Path) -> Tuple[List[str], List[Dict[str, Any]]]:
-    """Legge CSV (header + righe come dict)."""
+def _read_header(path: Path) -> List[str]:
     if not path.exists():
-        return [], []
+        return []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def iter_rows(path: Path, columns: List[str]) -> Iterator[Tuple]:
+    """Legge il CSV in streaming: una tupla per riga, nell'ordine di columns."""
     with open(path, "r", encoding="utf-8", newline="") as f:
         r = csv.reader(f)
-        try:
-            header = next(r)
-        except StopIteration:
-            return [], []
-        rows = []
+        header = next(r, [])
+        idx = [header.index(c) for c in columns]
         for row in r:
             row = row + [""] * (len(header) - len(row))  # pad se mancano colonne
-            obj = {header[i]: _to_number_or_str(row[i]) for i in range(len(header))}
-            rows.append(obj)
-        return header, rows
+            yield tuple(_to_number_or_str(row[i]) for i in idx)
 
 
 def _norm_value(v: Any) -> Any:
-    """Normalizza i valori per il confronto insiemistico."""
+    """Normalizza i valori per il confronto."""
     if isinstance(v, float):
         # arrotonda per stabilizzare il confronto
         if math.isnan(v):
@@ -58,19 +65,137 @@ def _norm_value(v: Any) -> Any:
     return v
 
 
-def rows_to_keyset(rows: List[Dict[str, Any]], columns: List[str]) -> Set[Tuple]:
-    """Converte lista di dict in set di tuple ordinate secondo columns."""
-    keyset = set()
-    for row in rows:
-        key = tuple(_norm_value(row.get(col)) for col in columns)
-        keyset.add(key)
-    return keyset
+def _sortable(v: Any) -> Tuple:
+    """Chiave totale per valori misti (numeri < stringhe < None)."""
+    if v is None:
+        return (2, "")
+    if isinstance(v, (int, float)):
+        return (0, v)
+    return (1, str(v))
+
+
+class _Desc:
+    """Inverte l'ordinamento di una chiave (ORDER BY ... DESC)."""
+    __slots__ = ("v",)
+
+    def __init__(self, v):
+        self.v = v
+
+    def __lt__(self, other):
+        return other.v < self.v
+
+    def __eq__(self, other):
+        return self.v == other.v
+
+
+def _row_key(t: Tuple) -> Tuple:
+    """Identità di una riga: valori normalizzati (le chiavi ORDER BY usano invece i valori grezzi)."""
+    return tuple(_sortable(_norm_value(v)) for v in t)
+
 
+def merge_sorted_multisets(a: List[Tuple], b: List[Tuple]) -> Tuple[List[Tuple], List[Tuple]]:
+    """
+    Differenza tra due multinsiemi già ordinati per _row_key, in un solo passaggio.
+    Le righe duplicate contano: ogni occorrenza in più finisce nel lato corrispondente.
+    """
+    only_a, only_b = [], []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        ka, kb = _row_key(a[i]), _row_key(b[j])
+        if ka == kb:
+            i += 1
+            j += 1
+        elif ka < kb:
+            only_a.append(a[i])
+            i += 1
+        else:
+            only_b.append(b[j])
+            j += 1
+    only_a.extend(a[i:])
+    only_b.extend(b[j:])
+    return only_a, only_b
 
-def compare_two_csv(mysql_csv: Path, neo4j_csv: Path,REPORTS_DIR) -> Dict[str, Any]:
-    """Confronta due risultati (stesse colonne in comune)."""
-    mh, mr = load_table(mysql_csv)
-    nh, nr = load_table(neo4j_csv)
+
+def _tie_groups(rows: Iterator[Tuple], order_key, side: str, problems: List[str]) -> Iterator[Tuple[Any, List[Tuple]]]:
+    """
+    Raggruppa uno stream già ordinato in gruppi di pari merito (stessa chiave ORDER BY),
+    verificando che l'ordinamento sia rispettato. Ogni gruppo è ordinato per _row_key.
+    """
+    prev = None
+    for key, group in groupby(rows, key=order_key):
+        if prev is not None and key < prev and not problems:
+            problems.append(f"{side} output not sorted by ORDER BY keys")
+        prev = key
+        yield key, sorted(group, key=_row_key)
+
+
+def compare_ordered(m_rows, n_rows, order_key, limit, problems):
+    """
+    Merge in streaming di due risultati ORDER BY, gruppo di pari merito per gruppo.
+    Dentro un gruppo l'ordine non è definito, quindi si confronta come multinsieme.
+    Con LIMIT, l'ultimo gruppo può essere tagliato in punti diversi dai due engine:
+    se entrambi i risultati sono pieni e l'ultimo gruppo ha la stessa chiave e la
+    stessa dimensione, le differenze in quel gruppo non sono errori (tie rows).
+    Le righe rimaste spaiate vengono riconciliate come multinsiemi sui valori
+    normalizzati: una chiave float arrotondata diversamente dai due engine
+    (es. 4.22 vs 4.23) sposta la riga di gruppo ma non è una differenza.
+    """
+    counts = {"mysql": 0, "neo4j": 0}
+    only_m, only_n = [], []
+    last = None  # differenze dell'ultimo passo, decise solo a fine stream
+
+    def counted(rows, side):
+        for t in rows:
+            counts[side] += 1
+            yield t
+
+    gm_it = _tie_groups(counted(m_rows, "mysql"), order_key, "mysql", problems)
+    gn_it = _tie_groups(counted(n_rows, "neo4j"), order_key, "neo4j", problems)
+    gm, gn = next(gm_it, None), next(gn_it, None)
+    while gm is not None or gn is not None:
+        if last is not None:
+            only_m.extend(last[2])
+            only_n.extend(last[3])
+        if gn is None or (gm is not None and gm[0] < gn[0]):
+            last = (False, None, gm[1], [])
+            gm = next(gm_it, None)
+        elif gm is None or gn[0] < gm[0]:
+            last = (False, None, [], gn[1])
+            gn = next(gn_it, None)
+        else:
+            om, on = merge_sorted_multisets(gm[1], gn[1])
+            last = (True, len(gm[1]) == len(gn[1]), om, on)
+            gm, gn = next(gm_it, None), next(gn_it, None)
+
+    tie_m, tie_n = [], []
+    if last is not None:
+        same_key, same_size, om, on = last
+        at_limit = limit is not None and counts["mysql"] == limit and counts["neo4j"] == limit
+        if at_limit and same_key and same_size:
+            tie_m, tie_n = om, on
+        else:
+            only_m.extend(om)
+            only_n.extend(on)
+    only_m, only_n = merge_sorted_multisets(sorted(only_m, key=_row_key), sorted(only_n, key=_row_key))
+    return counts, only_m, only_n, tie_m, tie_n
+
+
+def compare_unordered(m_rows, n_rows):
+    """Confronto come multinsiemi: ordinamento dei due stream e merge lineare."""
+    m_sorted = sorted(m_rows, key=_row_key)
+    n_sorted = sorted(n_rows, key=_row_key)
+    only_m, only_n = merge_sorted_multisets(m_sorted, n_sorted)
+    return {"mysql": len(m_sorted), "neo4j": len(n_sorted)}, only_m, only_n, [], []
+
+
+def compare_two_csv(mysql_csv: Path, neo4j_csv: Path,REPORTS_DIR, diff_prefix: str = "diff", meta: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Confronta due risultati (stesse colonne in comune) secondo i metadati della query:
+    merge ordinato per le query con ORDER BY (con tolleranza dei pari merito al LIMIT),
+    confronto come multinsiemi per le altre.
+    """
+    mh = _read_header(mysql_csv)
+    nh = _read_header(neo4j_csv)
 
     # intersezione colonne; se vuota, confronto impossibile
     common_cols = [c for c in mh if c in nh]
@@ -78,38 +203,55 @@ def compare_two_csv(mysql_csv: Path, neo4j_csv: Path,REPORTS_DIR) -> Dict[str, A
         return {
             "query": mysql_csv.stem,
             "status": "no_common_columns",
-            "mysql_rows": len(mr),
-            "neo4j_rows": len(nr),
+            "mysql_rows": sum(1 for _ in iter_rows(mysql_csv, [])) if mh else 0,
+            "neo4j_rows": sum(1 for _ in iter_rows(neo4j_csv, [])) if nh else 0,
             "only_mysql": 0,
             "only_neo4j": 0,
             "details": f"No common columns between {mh} and {nh}",
         }
 
-    mset = rows_to_keyset(mr, common_cols)
-    nset = rows_to_keyset(nr, common_cols)
+    meta = meta or {}
+    order_by = [(c, d) for c, d in meta.get("order_by", []) if c in common_cols]
+    limit = meta.get("limit")
+    m_rows = iter_rows(mysql_csv, common_cols)
+    n_rows = iter_rows(neo4j_csv, common_cols)
+    problems: List[str] = []
+
+    if order_by and len(order_by) == len(meta.get("order_by", [])):
+        key_idx = [(common_cols.index(c), d.lower() == "desc") for c, d in order_by]
+
+        def order_key(t):
+            return tuple(_Desc(_sortable(t[i])) if desc else _sortable(t[i]) for i, desc in key_idx)
+
+        mode = "ordered"
+        counts, only_m, only_n, tie_m, tie_n = compare_ordered(m_rows, n_rows, order_key, limit, problems)
+    else:
+        mode = "multiset"
+        counts, only_m, only_n, tie_m, tie_n = compare_unordered(m_rows, n_rows)
 
-    only_m = mset - nset
-    only_n = nset - mset
-    equal = len(only_m) == 0 and len(only_n) == 0
+    equal = not only_m and not only_n and not problems
 
     # salva un diff dettagliato per la query
-    diff_path = REPORTS_DIR / f"diff_{mysql_csv.stem}.csv"
+    diff_path = REPORTS_DIR / f"{diff_prefix}_{mysql_csv.stem}.csv"
     with open(diff_path, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
         w.writerow(["side", *common_cols])
-        for t in sorted(only_m):
-            w.writerow(["only_mysql", *t])
-        for t in sorted(only_n):
-            w.writerow(["only_neo4j", *t])
+        for side, rows in [("only_mysql", only_m), ("only_neo4j", only_n), ("tie_mysql", tie_m), ("tie_neo4j", tie_n)]:
+            for t in rows:
+                w.writerow([side, *t])
 
+    details = [f"{mode} compare", f"Diff saved to {diff_path.name}"]
+    if tie_m:
+        details.append(f"{len(tie_m)} rows differ only within the tie group at LIMIT {limit}")
+    details.extend(problems)
     return {
         "query": mysql_csv.stem,
         "status": "equal" if equal else "different",
-        "mysql_rows": len(mr),
-        "neo4j_rows": len(nr),
+        "mysql_rows": counts["mysql"],
+        "neo4j_rows": counts["neo4j"],
         "only_mysql": len(only_m),
         "only_neo4j": len(only_n),
-        "details": f"Diff saved to {diff_path.name}",
+        "details": "; ".join(details),
     }
 
 
@@ -134,6 +276,8 @@ def write_summary_report(results: List[Dict[str, Any]],REPORTS_DIR) -> Path:
                 "only_in_mysql",
                 "only_in_neo4j",
                 "details",
+                "csr_status",
+                "csr_rows",
             ]
         )
         for r in results:
@@ -146,6 +290,8 @@ def write_summary_report(results: List[Dict[str, Any]],REPORTS_DIR) -> Path:
                     r["only_mysql"],
                     r["only_neo4j"],
                     r.get("details", ""),
+                    r.get("csr_status", ""),
+                    r.get("csr_rows", ""),
                 ]
             )
     return out
@@ -157,6 +303,9 @@ def main():
     )
     parser.add_argument("--run", action="store_true", help="Run mysql.py and neo4j.py before comparing.")
     parser.add_argument("--use_index", action="store_true", help="Usa gli indici e salva in result_with_indexes/")
+    parser.add_argument("--resume", action="store_true", help="Non cancella i risultati precedenti e salta le unità (engine, query, indici) già completate e invariate.")
+    parser.add_argument("--csr", action="store_true", help="Esegue anche i kernel sullo snapshot CSR (terza colonna del confronto).")
+    parser.add_argument("--export_csr", action="store_true", help="Riesporta lo snapshot CSR da MySQL prima di eseguire i kernel.")
     args = parser.parse_args()
 
     # Root dinamico
@@ -164,11 +313,16 @@ def main():
     RESULTS_ROOT = Path("results_with_indexes") if args.use_index else Path("results")
     MYSQL_DIR = RESULTS_ROOT / "MySql"
     NEO4J_DIR = RESULTS_ROOT / "Neo4j"
+    CSR_DIR = RESULTS_ROOT / "csr"
     REPORTS_DIR = RESULTS_ROOT / "reports"
     PLOTS_DIR = RESULTS_ROOT / "plots"
+    CHECKPOINT_DIR = RESULTS_ROOT / CHECKPOINT_DIRNAME
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
-    for folder in [MYSQL_DIR, NEO4J_DIR, REPORTS_DIR,PLOTS_DIR]:
+    for folder in [MYSQL_DIR, NEO4J_DIR, CSR_DIR, CHECKPOINT_DIR, REPORTS_DIR,PLOTS_DIR]:
         folder.mkdir(parents=True, exist_ok=True)
+        # con --resume i risultati e i checkpoint delle unità completate restano
+        if args.resume and folder not in (REPORTS_DIR, PLOTS_DIR):
+            continue
         # Elimina tutti i file all'interno
         for f in folder.iterdir():
             if f.is_file():
@@ -177,8 +331,10 @@ def main():
                 shutil.rmtree(f)
 
     if args.run:
-        mainMySql(RESULTS_ROOT,use_indexes)
-        mainNeo4j(RESULTS_ROOT,use_indexes)
+        mainMySql(RESULTS_ROOT,use_indexes,resume=args.resume)
+        mainNeo4j(RESULTS_ROOT,use_indexes,resume=args.resume)
+    if args.csr or args.export_csr:
+        mainCsr(RESULTS_ROOT, use_indexes, export=args.export_csr, resume=args.resume)
 
     pairs = find_common_query_files(MYSQL_DIR,NEO4J_DIR)
     if not pairs:
@@ -189,12 +345,20 @@ def main():
     results = []
     print("▶️ Comparing results…")
     for mfile, nfile in pairs:
-        r = compare_two_csv(mfile, nfile,REPORTS_DIR)
+        meta = QUERY_META.get(mfile.stem)
+        r = compare_two_csv(mfile, nfile,REPORTS_DIR, meta=meta)
+        # terza colonna: risultato dello snapshot CSR confrontato con MySQL
+        cfile = CSR_DIR / mfile.name
+        if cfile.exists():
+            c = compare_two_csv(mfile, cfile, REPORTS_DIR, diff_prefix="diff_csr", meta=meta)
+            r["csr_status"] = c["status"]
+            r["csr_rows"] = c["neo4j_rows"]
         results.append(r)
         status_icon = "✅" if r["status"] == "equal" else "❌"
+        csr_info = f", csr={r['csr_rows']} ({r['csr_status']})" if "csr_status" in r else ""
         print(
             f"{status_icon} {r['query']}: {r['status']} "
-            f"(rows mysql={r['mysql_rows']}, neo4j={r['neo4j_rows']}, "
+            f"(rows mysql={r['mysql_rows']}, neo4j={r['neo4j_rows']}{csr_info}, "
             f"only_mysql={r['only_mysql']}, only_neo4j={r['only_neo4j']})"
         )
 
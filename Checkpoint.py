@@ -0,0 +1,111 @@
+from pathlib import Path
+import csv
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+
+# ------------------------------
+# Checkpoint per unità (engine, query, modalità indici).
+# Ogni unità completata scrive RESULTS_ROOT/checkpoints/<engine>_<query>.json
+# in modo atomico (file temporaneo + os.replace) DOPO aver salvato i suoi CSV:
+# se il processo muore a metà, l'unità non risulta completata e viene rieseguita.
+# La chiave è l'hash di testo della query, parametri e modalità indici, così
+# con --resume si rieseguono solo le unità mancanti o modificate.
+# ------------------------------
+CHECKPOINT_DIRNAME = "checkpoints"
+SUMMARY_HEADER = ["timestamp", "query_name", "runs", "avg_ms", "stdev_ms", "min_ms", "max_ms", "rows_last"]
+
+
+def unit_key(engine, text, params, use_indexes):
+    """Hash stabile di una unità di benchmark."""
+    payload = json.dumps(
+        {"engine": engine, "text": text, "params": params, "use_indexes": bool(use_indexes)},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _checkpoint_path(RESULTS_ROOT, engine, name):
+    return Path(RESULTS_ROOT) / CHECKPOINT_DIRNAME / f"{engine}_{name}.json"
+
+
+def load_checkpoint(RESULTS_ROOT, engine, name):
+    path = _checkpoint_path(RESULTS_ROOT, engine, name)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # checkpoint illeggibile: l'unità va rieseguita
+
+
+def is_done(RESULTS_ROOT, engine, name, key):
+    """True se l'unità ha un checkpoint con la stessa chiave e tutti i suoi output esistono."""
+    cp = load_checkpoint(RESULTS_ROOT, engine, name)
+    if cp is None or cp.get("key") != key:
+        return False
+    return all((Path(RESULTS_ROOT) / p).exists() for p in cp.get("outputs", []))
+
+
+def discard_stale(RESULTS_ROOT, engine, keys):
+    """
+    Elimina checkpoint e output delle unità non completate con la chiave attuale
+    (keys: {query: chiave}). Così una query modificata la cui nuova esecuzione
+    fallisce non lascia tempi e risultati della versione precedente.
+    """
+    for name, key in keys.items():
+        cp = load_checkpoint(RESULTS_ROOT, engine, name)
+        if cp is None or is_done(RESULTS_ROOT, engine, name, key):
+            continue
+        for p in cp.get("outputs", []):
+            out = Path(RESULTS_ROOT) / p
+            if out.exists():
+                out.unlink()
+        _checkpoint_path(RESULTS_ROOT, engine, name).unlink()
+
+
+def atomic_write_text(path, text):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_checkpoint(RESULTS_ROOT, engine, name, key, summary_row, outputs):
+    """Registra l'unità come completata. outputs: path dei CSV relativi a RESULTS_ROOT."""
+    cp = {
+        "engine": engine,
+        "query": name,
+        "key": key,
+        "summary_row": summary_row,
+        "outputs": [str(Path(p).relative_to(RESULTS_ROOT)) for p in outputs],
+        "completed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    atomic_write_text(_checkpoint_path(RESULTS_ROOT, engine, name), json.dumps(cp, indent=2))
+
+
+def write_summary(RESULTS_ROOT, engine, keys, summary_file):
+    """
+    Riscrive il summary dell'engine dai checkpoint, nell'ordine di keys ({query: chiave}).
+    I checkpoint con una chiave diversa da quella attuale non vengono riportati.
+    """
+    rows = []
+    for name, key in keys.items():
+        cp = load_checkpoint(RESULTS_ROOT, engine, name)
+        if cp is not None and cp.get("key") == key:
+            rows.append(cp["summary_row"])
+
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(SUMMARY_HEADER)
+    for row in rows:
+        w.writerow(row)
+    atomic_write_text(summary_file, buf.getvalue())
@@ -1,35 +1,106 @@
+import base64
+import html
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # nessun display: le figure vengono solo salvate (anche nei worker)
 import matplotlib.pyplot as plt
-import os
+
+# (cartella/prefisso dei CSV per-run, etichetta nei grafici)
+ENGINES = [("mysql", "MySQL"), ("neo4j", "Neo4j"), ("csr", "CSR snapshot")]
+PERCENTILES = [50, 90, 99]
+BOOTSTRAP_SAMPLES = 2000
+BOOTSTRAP_SEED = 0
 
 
 def load_results(file_path):
     """Carica i risultati CSV di una query."""
     return pd.read_csv(file_path)
 
-def plot_comparison(mysql_df, neo4j_df, query_name,OUTPUT_DIR):
+def plot_comparison(mysql_df, neo4j_df, query_name,OUTPUT_DIR, csr_df=None):
     """Genera grafici comparativi per una singola query."""
     plt.figure()
-    plt.plot(mysql_df.index, mysql_df["time_ms"], marker="o", label="MySQL")
-    plt.plot(neo4j_df.index, neo4j_df["time_ms"], marker="o", label="Neo4j")
+    plt.plot(mysql_df["run"], mysql_df["time_ms"], marker="o", label="MySQL")
+    plt.plot(neo4j_df["run"], neo4j_df["time_ms"], marker="o", label="Neo4j")
+    if csr_df is not None:
+        plt.plot(csr_df["run"], csr_df["time_ms"], marker="o", label="CSR snapshot")
     plt.title(f"Execution Times - {query_name}")
-    plt.xlabel("Execution")
+    plt.xlabel("Run")
     plt.ylabel("Time (ms)")
     plt.legend()
     plt.savefig(f"{OUTPUT_DIR}/{query_name}_lineplot.png")
     plt.close()
 
-def plot_summary(mysql_summary, neo4j_summary,OUTPUT_DIR):
-    """Grafico comparativo tempi medi su tutte le query."""
+def plot_resources(engine_dfs, query_name, OUTPUT_DIR):
+    """Telemetria per run (colonne di Telemetry) in funzione del tempo di esecuzione."""
+    panels = [
+        ("server_cpu_ms", "Server CPU time (ms)"),
+        ("server_rss_peak_kb", "Server peak RSS (KB)"),
+        ("server_io_bytes", "Server read+write (bytes)"),
+        ("client_cpu_ms", "Client CPU time (ms)"),
+    ]
+    engine_dfs = {
+        label: df for label, df in engine_dfs.items()
+        if df is not None and "client_cpu_ms" in df.columns
+    }
+    if not engine_dfs:
+        return  # CSV senza telemetria (run precedenti)
+
+    fig, axes = plt.subplots(2, 2, figsize=(12, 8))
+    for ax, (col, ylabel) in zip(axes.flat, panels):
+        for label, df in engine_dfs.items():
+            if col == "server_io_bytes":
+                y = df.get("server_read_bytes", 0) + df.get("server_write_bytes", 0)
+            else:
+                y = df.get(col)
+            if y is None or pd.isna(y).all():
+                continue
+            ax.scatter(df["time_ms"], y, label=label)
+        ax.set_xlabel("Time (ms)")
+        ax.set_ylabel(ylabel)
+        if ax.get_legend_handles_labels()[0]:
+            ax.legend()
+    fig.suptitle(f"Resources vs Execution Time - {query_name}")
+    fig.tight_layout()
+    fig.savefig(f"{OUTPUT_DIR}/{query_name}_resources.png")
+    plt.close(fig)
+
+def summary_by_name(mysql_summary, neo4j_summary, csr_summary=None):
+    """Unisce gli avg_ms dei summary per query_name (query mancanti in un engine -> NaN)."""
+    merged = mysql_summary[["query_name", "avg_ms"]].rename(columns={"avg_ms": "MySQL"}).merge(
+        neo4j_summary[["query_name", "avg_ms"]].rename(columns={"avg_ms": "Neo4j"}),
+        on="query_name", how="outer", sort=False,
+    )
+    if csr_summary is not None:
+        merged = merged.merge(
+            csr_summary[["query_name", "avg_ms"]].rename(columns={"avg_ms": "CSR snapshot"}),
+            on="query_name", how="left",
+        )
+    return merged
+
+def plot_summary(mysql_summary, neo4j_summary,OUTPUT_DIR, csr_summary=None):
+    """Grafico comparativo tempi medi su tutte le query (allineate per nome, non per posizione)."""
+    merged = summary_by_name(mysql_summary, neo4j_summary, csr_summary)
     plt.figure(figsize=(12, 6))  # figura più larga
-    x = range(len(mysql_summary))
+    x = np.arange(len(merged))
 
-    # barre MySQL e Neo4j
-    plt.bar([i-0.2 for i in x], mysql_summary["avg_ms"], width=0.4, label="MySQL")
-    plt.bar([i+0.2 for i in x], neo4j_summary["avg_ms"], width=0.4, label="Neo4j")
+    if csr_summary is None:
+        # barre MySQL e Neo4j
+        plt.bar(x-0.2, merged["MySQL"], width=0.4, label="MySQL")
+        plt.bar(x+0.2, merged["Neo4j"], width=0.4, label="Neo4j")
+    else:
+        # terza barra per lo snapshot CSR (solo per le query che hanno un kernel)
+        plt.bar(x-0.27, merged["MySQL"], width=0.27, label="MySQL")
+        plt.bar(x, merged["Neo4j"], width=0.27, label="Neo4j")
+        plt.bar(x+0.27, merged["CSR snapshot"], width=0.27, label="CSR snapshot")
 
     # etichette più leggibili (rotazione + allineamento)
-    plt.xticks(x, mysql_summary["query_name"], rotation=45, ha="right")
+    plt.xticks(x, merged["query_name"], rotation=45, ha="right")
 
     plt.title("Average Execution Time Comparison (log scale)")
     plt.ylabel("Average Time (ms)")
@@ -43,26 +114,212 @@ def plot_graphs(RESULTS_ROOT):
     # Carica i summary
     MYSQL_DIR = RESULTS_ROOT / "mysql"
     NEO4J_DIR = RESULTS_ROOT / "neo4j"
+    CSR_DIR = RESULTS_ROOT / "csr"
     MYSQL_SUMMARY = MYSQL_DIR / "mysql_summary.csv"
     NEO4J_SUMMARY = NEO4J_DIR / "neo4j_summary.csv"
+    CSR_SUMMARY = CSR_DIR / "csr_summary.csv"
     OUTPUT_DIR = RESULTS_ROOT / "plots"
 
     mysql_summary = pd.read_csv(MYSQL_SUMMARY)
     neo4j_summary = pd.read_csv(NEO4J_SUMMARY)
+    csr_summary = pd.read_csv(CSR_SUMMARY) if os.path.exists(CSR_SUMMARY) else None
 
     # Grafico riassuntivo generale
-    plot_summary(mysql_summary, neo4j_summary,OUTPUT_DIR)
+    plot_summary(mysql_summary, neo4j_summary,OUTPUT_DIR, csr_summary)
 
-    # Cicla sulle query (assumendo stesso ordine nei summary)
-    for query in mysql_summary["query_name"]:
+    # Cicla sulle query, abbinate per nome tra i summary
+    for query in summary_by_name(mysql_summary, neo4j_summary)["query_name"]:
         mysql_file = os.path.join(MYSQL_DIR, f"mysql_{query}.csv")
         neo4j_file = os.path.join(NEO4J_DIR, f"neo4j_{query}.csv")
 
         if os.path.exists(mysql_file) and os.path.exists(neo4j_file):
             mysql_df = load_results(mysql_file)
             neo4j_df = load_results(neo4j_file)
-            plot_comparison(mysql_df, neo4j_df, query,OUTPUT_DIR)
+            csr_file = os.path.join(CSR_DIR, f"csr_{query}.csv")
+            csr_df = load_results(csr_file) if os.path.exists(csr_file) else None
+            plot_comparison(mysql_df, neo4j_df, query,OUTPUT_DIR, csr_df)
+            plot_resources({"MySQL": mysql_df, "Neo4j": neo4j_df, "CSR snapshot": csr_df}, query, OUTPUT_DIR)
+
+    # Report HTML con le distribuzioni di latenza
+    write_report(RESULTS_ROOT)
+
+# ------------------------------
+# Report delle distribuzioni di latenza (HTML autocontenuto)
+# ------------------------------
+def load_runs(RESULTS_ROOT):
+    """{query: {engine: array dei time_ms}} dai CSV per-run <prefix>_<query>.csv."""
+    runs = {}
+    for prefix, label in ENGINES:
+        folder = Path(RESULTS_ROOT) / prefix
+        if not folder.exists():
+            continue
+        for f in sorted(folder.glob(f"{prefix}_*.csv")):
+            query = f.stem[len(prefix) + 1:]
+            if query == "summary":
+                continue
+            df = pd.read_csv(f)
+            if "time_ms" in df.columns and len(df):
+                runs.setdefault(query, {})[label] = df["time_ms"].to_numpy(dtype=float)
+    return runs
+
+def percentile_table(runs):
+    rows = []
+    for query, engines in runs.items():
+        for label, times in engines.items():
+            row = {"query": query, "engine": label, "runs": len(times), "mean_ms": times.mean()}
+            for p in PERCENTILES:
+                row[f"p{p}_ms"] = np.percentile(times, p)
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+def bootstrap_speedup(baseline, contender, n_boot=BOOTSTRAP_SAMPLES, seed=BOOTSTRAP_SEED):
+    """Speedup = media(baseline) / media(contender), con IC 95% bootstrap (percentile)."""
+    rng = np.random.default_rng(seed)
+    b = rng.choice(baseline, size=(n_boot, len(baseline))).mean(axis=1)
+    c = rng.choice(contender, size=(n_boot, len(contender))).mean(axis=1)
+    ratios = b / c
+    return baseline.mean() / contender.mean(), np.percentile(ratios, 2.5), np.percentile(ratios, 97.5)
+
+def speedup_table(runs):
+    """Speedup di ogni engine rispetto a MySQL (> 1: più veloce di MySQL)."""
+    rows = []
+    for query, engines in runs.items():
+        if "MySQL" not in engines:
+            continue
+        for label, times in engines.items():
+            if label == "MySQL":
+                continue
+            ratio, lo, hi = bootstrap_speedup(engines["MySQL"], times)
+            rows.append({"query": query, "baseline": "MySQL", "engine": label,
+                         "speedup": ratio, "ci95_low": lo, "ci95_high": hi})
+    return pd.DataFrame(rows)
+
+def index_table(runs_no_index, runs_with_index):
+    """p50 con e senza indici per ogni (query, engine) presente in entrambe le modalità."""
+    rows = []
+    for query, engines in runs_no_index.items():
+        for label, times in engines.items():
+            other = runs_with_index.get(query, {}).get(label)
+            if other is not None:
+                rows.append({"query": query, "engine": label,
+                             "no_index_p50_ms": np.median(times), "with_index_p50_ms": np.median(other)})
+    return pd.DataFrame(rows)
+
+def _fig_to_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=100)
+    plt.close(fig)
+    return buf.getvalue()
+
+def render_ecdf(query, engines):
+    fig, ax = plt.subplots(figsize=(7, 4))
+    for label, times in engines.items():
+        xs = np.sort(times)
+        ax.step(xs, np.arange(1, len(xs) + 1) / len(xs), where="post", label=label)
+    ax.set_xscale("log")
+    ax.set_xlabel("Time (ms)")
+    ax.set_ylabel("ECDF")
+    ax.set_title(f"ECDF - {query}")
+    ax.legend()
+    fig.tight_layout()
+    return _fig_to_png(fig)
+
+def render_violin(query, engines):
+    fig, ax = plt.subplots(figsize=(7, 4))
+    labels = list(engines)
+    # log10 dei tempi: gli engine differiscono di ordini di grandezza
+    ax.violinplot([np.log10(engines[l]) for l in labels], showmedians=True)
+    ax.set_xticks(range(1, len(labels) + 1), labels)
+    ax.set_ylabel("log10 Time (ms)")
+    ax.set_title(f"Latency distribution - {query}")
+    fig.tight_layout()
+    return _fig_to_png(fig)
+
+def render_speedup(speedups):
+    fig, ax = plt.subplots(figsize=(9, 0.5 * len(speedups) + 1.5))
+    y = np.arange(len(speedups))
+    err = [speedups["speedup"] - speedups["ci95_low"], speedups["ci95_high"] - speedups["speedup"]]
+    ax.errorbar(speedups["speedup"], y, xerr=err, fmt="o", capsize=4)
+    ax.axvline(1.0, color="grey", linestyle="--")
+    ax.set_yticks(y, [f"{q} ({e})" for q, e in zip(speedups["query"], speedups["engine"])])
+    ax.set_xscale("log")
+    ax.set_xlabel("Speedup vs MySQL (mean ratio, 95% bootstrap CI)")
+    fig.tight_layout()
+    return _fig_to_png(fig)
+
+def render_index_panel(index_df):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    x = np.arange(len(index_df))
+    ax.bar(x - 0.2, index_df["no_index_p50_ms"], width=0.4, label="without indexes")
+    ax.bar(x + 0.2, index_df["with_index_p50_ms"], width=0.4, label="with indexes")
+    ax.set_xticks(x, [f"{q} ({e})" for q, e in zip(index_df["query"], index_df["engine"])], rotation=45, ha="right")
+    ax.set_yscale("log")
+    ax.set_ylabel("p50 Time (ms)")
+    ax.set_title("With vs without indexes (p50)")
+    ax.legend()
+    fig.tight_layout()
+    return _fig_to_png(fig)
+
+def _other_index_root(RESULTS_ROOT):
+    """Cartella dei risultati dell'altra modalità indici (results <-> results_with_indexes)."""
+    RESULTS_ROOT = Path(RESULTS_ROOT)
+    other = "results" if RESULTS_ROOT.name == "results_with_indexes" else "results_with_indexes"
+    return RESULTS_ROOT.parent / other
+
+def write_report(RESULTS_ROOT):
+    """Genera reports/performance_report.html con tabelle e grafici (PNG inline)."""
+    RESULTS_ROOT = Path(RESULTS_ROOT)
+    runs = load_runs(RESULTS_ROOT)
+    if not runs:
+        return None
+    percentiles = percentile_table(runs)
+    speedups = speedup_table(runs)
+
+    other_runs = load_runs(_other_index_root(RESULTS_ROOT))
+    if RESULTS_ROOT.name == "results_with_indexes":
+        index_df = index_table(other_runs, runs)
+    else:
+        index_df = index_table(runs, other_runs)
+
+    # ogni figura è indipendente: rendering in parallelo su processi separati
+    tasks = []
+    for query in sorted(runs):
+        tasks.append((f"ECDF - {query}", render_ecdf, (query, runs[query])))
+        tasks.append((f"Violin - {query}", render_violin, (query, runs[query])))
+    if len(speedups):
+        tasks.append(("Speedup vs MySQL", render_speedup, (speedups,)))
+    if len(index_df):
+        tasks.append(("With vs without indexes", render_index_panel, (index_df,)))
+
+    with ProcessPoolExecutor() as pool:
+        futures = [(title, pool.submit(fn, *args)) for title, fn, args in tasks]
+        images = [(title, f.result()) for title, f in futures]
+
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+        f"<title>Performance report - {html.escape(RESULTS_ROOT.name)}</title>",
+        "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}"
+        "td,th{border:1px solid #ccc;padding:4px 8px;text-align:right}</style></head><body>",
+        f"<h1>Performance report - {html.escape(RESULTS_ROOT.name)}</h1>",
+        "<h2>Latency percentiles</h2>",
+        percentiles.to_html(index=False, float_format="%.2f"),
+    ]
+    if len(speedups):
+        parts += ["<h2>Speedup vs MySQL</h2>", speedups.to_html(index=False, float_format="%.3f")]
+    if len(index_df):
+        parts += ["<h2>With vs without indexes</h2>", index_df.to_html(index=False, float_format="%.2f")]
+    for title, png in images:
+        data = base64.b64encode(png).decode("ascii")
+        parts.append(f"<h3>{html.escape(title)}</h3><img src='data:image/png;base64,{data}'>")
+    parts.append("</body></html>")
+
+    out = RESULTS_ROOT / "reports" / "performance_report.html"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        f.write("\n".join(parts))
+    print(f"📄 Performance report written to {out}")
+    return out
 
 if __name__ == "__main__":
     # Carica i summary
-    plot_graphs()
\ No newline at end of file
+    plot_graphs(Path("results"))
\ No newline at end of file
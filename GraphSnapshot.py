@@ -0,0 +1,283 @@
+from pathlib import Path
+import inspect
+import json
+import os
+import time
+import statistics
+import traceback
+from datetime import datetime
+
+import mysql.connector
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from MySql import CONFIG, save_runs_csv, save_last_result_csv
+from Checkpoint import unit_key, is_done, discard_stale, save_checkpoint, write_summary
+from Telemetry import ResourceSampler
+
+# ------------------------------
+# Snapshot CSR del grafo bipartito User -[RATED]-> Movie (+ generi da HAS)
+# esportato da MySQL una volta sola e caricato via memmap.
+#
+# Layout (indici densi: utenti e film ordinati per id originale):
+# - user_ids.npy / movie_ids.npy   id originali per indice denso
+# - user_offsets.npy (U+1)         archi dell'utente i in [off[i], off[i+1])
+# - user_neighbors.npy (E)         indice denso del film per ogni arco
+# - edge_users.npy (E)             indice denso dell'utente proprietario dell'arco
+# - ratings.npy / timestamps.npy   sidecar allineato agli archi
+# - genre_offsets.npy / genre_movies.npy   CSR genere -> film
+# - meta.json                      nomi dei generi, titoli, dimensioni
+# ------------------------------
+SNAPSHOT_DIR = Path("csr_snapshot")
+FETCH_BATCH = 100_000
+OUTPUT_PREFIX = "csr"
+REPEATS = 10
+WARMUP_RUNS = 1
+
+QUERIES = [
+    {
+        "name": "fof_recs_uid42_depth3_scifi",
+        "params": {"uid": 42, "genre": "Sci-Fi", "min_rating": 4.0, "limit": 50},
+    },
+]
+
+
+def export_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """Esporta RATINGS, MOVIE e HAS da MySQL in uno snapshot CSR su disco."""
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = snapshot_dir / "meta.json"
+    if meta_path.exists():
+        meta_path.unlink()  # lo snapshot è valido solo quando meta.json è presente
+
+    conn = mysql.connector.connect(**CONFIG)
+    cursor = conn.cursor()
+    t0 = time.perf_counter()
+
+    cursor.execute("SELECT movieId, title FROM MOVIE ORDER BY movieId")
+    movies = cursor.fetchall()
+    movie_ids = np.array([m[0] for m in movies], dtype=np.int64)
+    titles = [m[1] for m in movies]
+    np.save(snapshot_dir / "movie_ids.npy", movie_ids)
+
+    cursor.execute("SELECT COUNT(*) FROM RATINGS")
+    (num_edges,) = cursor.fetchone()
+
+    edge_users = open_memmap(snapshot_dir / "edge_users.tmp.npy", mode="w+", dtype=np.int64, shape=(num_edges,))
+    neighbors = open_memmap(snapshot_dir / "user_neighbors.npy", mode="w+", dtype=np.int32, shape=(num_edges,))
+    ratings = open_memmap(snapshot_dir / "ratings.npy", mode="w+", dtype=np.float32, shape=(num_edges,))
+    timestamps = open_memmap(snapshot_dir / "timestamps.npy", mode="w+", dtype=np.int64, shape=(num_edges,))
+
+    # streaming a blocchi: l'ordinamento per (userId, movieId) dà direttamente il CSR
+    cursor.execute("SELECT userId, movieId, rating, timestamp FROM RATINGS ORDER BY userId, movieId")
+    pos = 0
+    while True:
+        batch = cursor.fetchmany(FETCH_BATCH)
+        if not batch:
+            break
+        users, movies_b, rates, ts = zip(*batch)
+        end = pos + len(batch)
+        edge_users[pos:end] = users
+        neighbors[pos:end] = np.searchsorted(movie_ids, np.asarray(movies_b, dtype=np.int64))
+        ratings[pos:end] = np.asarray(rates, dtype=np.float32)
+        timestamps[pos:end] = ts
+        pos = end
+
+    user_ids, starts = np.unique(edge_users[:pos], return_index=True)
+    np.save(snapshot_dir / "user_ids.npy", user_ids)
+    np.save(snapshot_dir / "user_offsets.npy", np.append(starts, pos).astype(np.int64))
+
+    # proprietario di ogni arco come indice denso dell'utente, a blocchi per non
+    # caricare in RAM l'intera colonna userId
+    edge_owner = open_memmap(snapshot_dir / "edge_users.npy", mode="w+", dtype=np.int32, shape=(pos,))
+    for lo in range(0, pos, FETCH_BATCH):
+        hi = min(lo + FETCH_BATCH, pos)
+        edge_owner[lo:hi] = np.searchsorted(user_ids, edge_users[lo:hi])
+    for arr in (edge_owner, neighbors, ratings, timestamps):
+        arr.flush()
+    del edge_users, edge_owner, neighbors, ratings, timestamps
+    os.remove(snapshot_dir / "edge_users.tmp.npy")
+
+    cursor.execute("SELECT name, movieId FROM HAS")
+    has = cursor.fetchall()
+    genres = sorted({g for g, _ in has})
+    # ordinamento lato client: la collation di MySQL non coincide con sorted() di Python
+    genre_idx = np.searchsorted(genres, [g for g, _ in has]).astype(np.int64)
+    genre_movies = np.searchsorted(movie_ids, np.array([m for _, m in has], dtype=np.int64))
+    order = np.lexsort((genre_movies, genre_idx))
+    genre_idx, genre_movies = genre_idx[order], genre_movies[order]
+    genre_offsets = np.searchsorted(genre_idx, np.arange(len(genres) + 1))
+    np.save(snapshot_dir / "genre_offsets.npy", genre_offsets.astype(np.int64))
+    np.save(snapshot_dir / "genre_movies.npy", genre_movies.astype(np.int32))
+
+    cursor.close()
+    conn.close()
+
+    meta = {
+        "num_users": int(len(user_ids)),
+        "num_movies": int(len(movie_ids)),
+        "num_edges": int(pos),
+        "genres": genres,
+        "titles": titles,
+        "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    tmp = meta_path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+    print(f"📦 CSR snapshot exported to {snapshot_dir} ({pos} edges) in {time.perf_counter() - t0:.1f} s")
+
+
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """Carica lo snapshot in memmap (nessuna copia: le pagine vengono lette on demand)."""
+    with open(snapshot_dir / "meta.json", "r", encoding="utf-8") as f:
+        snap = json.load(f)
+    for name in ["user_ids", "movie_ids", "user_offsets", "user_neighbors", "edge_users",
+                 "ratings", "timestamps", "genre_offsets", "genre_movies"]:
+        snap[name] = np.load(snapshot_dir / f"{name}.npy", mmap_mode="r")
+    return snap
+
+
+def fof_recs(snap, uid, genre, min_rating, limit):
+    """
+    Equivalente CSR di fof_recs_uid42_depth3_scifi.
+    l4 = utenti raggiungibili con seed -> m1 -> u2 -> m3 -> u4 con u2 != seed,
+    m3 != m1, u4 != u2, u4 != seed (stessi vincoli della query SQL).
+    Ogni passo è un filtro sugli archi con maschere booleane per nodo (bitset),
+    quindi il costo è lineare nel numero di archi.
+    """
+    num_users, num_movies = snap["num_users"], snap["num_movies"]
+    eu = snap["edge_users"]
+    em = snap["user_neighbors"]
+
+    seed = int(np.searchsorted(snap["user_ids"], uid))
+    if seed >= num_users or snap["user_ids"][seed] != uid:
+        return []
+    off = snap["user_offsets"]
+    seen = np.zeros(num_movies, dtype=bool)
+    seen[em[off[seed]:off[seed + 1]]] = True
+
+    # hop 1-2: per ogni u2 quanti film m1 ha in comune con il seed
+    e_m1 = seen[em]
+    n_m1 = np.bincount(eu[e_m1], minlength=num_users)
+    n_m1[seed] = 0
+    # se u2 ha un solo m1, quel film non può essere usato come m3
+    only_m1 = np.full(num_users, -1, dtype=np.int64)
+    single = e_m1 & (n_m1[eu] == 1)
+    only_m1[eu[single]] = em[single]
+
+    # hop 3: archi (u2, m3) validi; per ogni m3 conta i predecessori u2
+    e_m3 = (n_m1[eu] > 0) & (em != only_m1[eu])
+    n_u2 = np.bincount(em[e_m3], minlength=num_movies)
+    # se m3 ha un solo u2, u4 deve essere diverso da quello
+    only_u2 = np.full(num_movies, -1, dtype=np.int64)
+    single = e_m3 & (n_u2[em] == 1)
+    only_u2[em[single]] = eu[single]
+
+    # hop 4: u4 raggiungibile se esiste un m3 con un predecessore u2 != u4
+    e_u4 = (n_u2[em] >= 2) | ((n_u2[em] == 1) & (only_u2[em] != eu))
+    l4 = np.bincount(eu[e_u4], minlength=num_users) > 0
+    l4[seed] = False
+
+    # candidati: film del genere votati >= min_rating dagli utenti l4, non visti dal seed
+    in_genre = np.zeros(num_movies, dtype=bool)
+    if genre in snap["genres"]:
+        g = snap["genres"].index(genre)
+        in_genre[snap["genre_movies"][snap["genre_offsets"][g]:snap["genre_offsets"][g + 1]]] = True
+    cand = l4[eu] & (snap["ratings"] >= min_rating) & in_genre[em] & ~seen[em]
+    freq = np.bincount(em[cand], minlength=num_movies)
+
+    hits = np.flatnonzero(freq)
+    titles = snap["titles"]
+    top = sorted(hits.tolist(), key=lambda m: (-freq[m], titles[m]))[:limit]
+    return [(int(snap["movie_ids"][m]), titles[m], int(freq[m])) for m in top]
+
+
+KERNELS = {
+    "fof_recs_uid42_depth3_scifi": (fof_recs, ["movieId", "title", "freq"]),
+}
+
+
+def run_query_times_and_last(snap, kernel, params, repeats, warmups):
+    for _ in range(warmups):
+        kernel(snap, **params)
+
+    # nessun server: la telemetria riguarda solo il processo client
+    pids = {"client": os.getpid()}
+    times_ms, rows_last, resources = [], [], []
+    for _ in range(repeats):
+        with ResourceSampler(pids) as sampler:
+            t0 = time.perf_counter()
+            rows = kernel(snap, **params)
+            t1 = time.perf_counter()
+        times_ms.append((t1 - t0) * 1000.0)
+        resources.append(sampler.result)
+        rows_last = rows  # keep only the last run
+    return times_ms, rows_last, resources
+
+
+def mainCsr(RESULTS_ROOT, use_indexes=False, export=False, resume=False):
+    try:
+        if export or not (SNAPSHOT_DIR / "meta.json").exists():
+            export_snapshot(SNAPSHOT_DIR)
+
+        t0 = time.perf_counter()
+        snap = load_snapshot(SNAPSHOT_DIR)
+        print(f"\n📦 CSR snapshot loaded in {(time.perf_counter() - t0) * 1000.0:.2f} ms "
+              f"({snap['num_users']} users, {snap['num_movies']} movies, {snap['num_edges']} edges)")
+
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        RESULTS_DIR = RESULTS_ROOT / "csr"
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        summary_file = RESULTS_DIR / f"{OUTPUT_PREFIX}_summary.csv"
+        # il "testo" dell'unità è il sorgente del kernel più la versione dello snapshot
+        keys = {
+            q["name"]: unit_key(OUTPUT_PREFIX, inspect.getsource(KERNELS[q["name"]][0]) + snap["exported_at"], q["params"], use_indexes)
+            for q in QUERIES
+        }
+        # unità modificate o incomplete: via il vecchio checkpoint e i suoi CSV prima di rieseguirle
+        discard_stale(RESULTS_ROOT, OUTPUT_PREFIX, keys)
+        # summary subito coerente: niente righe di unità scartate anche se la nuova esecuzione fallisce
+        write_summary(RESULTS_ROOT, OUTPUT_PREFIX, keys, summary_file)
+
+        for q in QUERIES:
+            name = q["name"]
+            kernel, header = KERNELS[name]
+            key = keys[name]
+            if resume and is_done(RESULTS_ROOT, OUTPUT_PREFIX, name, key):
+                print(f"\n=== {name} === already completed, skipping (--resume)")
+                continue
+
+            # un errore su un kernel non butta via gli altri: l'unità resta senza checkpoint
+            try:
+                times_ms, rows_last, resources = run_query_times_and_last(snap, kernel, q["params"], REPEATS, WARMUP_RUNS)
+
+                avg = statistics.mean(times_ms)
+                stdev = statistics.stdev(times_ms) if len(times_ms) > 1 else 0.0
+                print(f"\n=== {name} ===")
+                print("Times (ms):", [round(t, 2) for t in times_ms])
+                print(f"Average: {avg:.2f} ms | StdDev: {stdev:.2f} ms | Min: {min(times_ms):.2f} ms | Max: {max(times_ms):.2f} ms")
+
+                runs_file = RESULTS_DIR / f"{OUTPUT_PREFIX}_{name}.csv"
+                result_file = RESULTS_DIR / f"{name}.csv"
+                save_runs_csv(runs_file, times_ms, resources)
+                save_last_result_csv(result_file, header, rows_last)
+                row = [ts, name, len(times_ms), f"{avg:.4f}", f"{stdev:.4f}", f"{min(times_ms):.4f}", f"{max(times_ms):.4f}", len(rows_last)]
+                save_checkpoint(RESULTS_ROOT, OUTPUT_PREFIX, name, key, row, [runs_file, result_file])
+                write_summary(RESULTS_ROOT, OUTPUT_PREFIX, keys, summary_file)
+                if rows_last:
+                    print("Sample rows (up to 5):")
+                    for r in rows_last[:5]:
+                        print(r)
+            except Exception as e:
+                print(f"CSR error on {name}:", e)
+                traceback.print_exc()
+
+        print("\nCSR benchmark completed.")
+    except Exception as e:
+        # come mainMySql/mainNeo4j: il confronto e i grafici in Application vengono comunque eseguiti
+        print("CSR error:", e)
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    mainCsr(Path("results"))
@@ -1,10 +1,15 @@
 from pathlib import Path
 import mysql.connector
+from mysql.connector import pooling
 import time
 import statistics
 import csv
 import traceback
+import os
 from datetime import datetime
+from Partitioned import PARTITIONS, user_ranges, run_partitioned_times_and_last
+from Checkpoint import unit_key, is_done, discard_stale, save_checkpoint, write_summary
+from Telemetry import ResourceSampler, COLUMNS as TELEMETRY_COLUMNS, find_mysqld_pid
 
 
 # Connection config
@@ -28,6 +33,8 @@ OUTPUT_PREFIX = "mysql"  # prefisso file csv
 # - name: nome breve usato nei file
 # - sql: stringa SQL (usa %s per i parametri)
 # - params: tuple di parametri in ordine
+# - order_by: chiavi dell'ORDER BY [(colonna, "asc"/"desc")], usate dal confronto dei risultati
+# - limit: LIMIT della query (None se assente): i pari merito al taglio non sono errori
 # ------------------------------
 QUERIES = [
     {
@@ -41,6 +48,7 @@ QUERIES = [
             ORDER BY avg_rating DESC, num_votes DESC
         """,
         "params": (),
+        "order_by": [("avg_rating", "desc"), ("num_votes", "desc")],
     },
     {
         "name": "recs_by_similar_users_uid42_mincommon10",
@@ -79,6 +87,7 @@ QUERIES = [
             ORDER BY c.avg_sim_rating DESC, c.votes DESC;
         """,
         "params": (42, 42, 10),
+        "order_by": [("avg_sim_rating", "desc"), ("votes", "desc")],
     },
     {
         "name": "fof_recs_uid42_depth3_scifi",
@@ -129,6 +138,9 @@ QUERIES = [
 
         """,
         "params": (42, 42, 42, 42),
+        # m.title non è una chiave: l'ordinamento dipende dalla collation e non è confrontabile tra engine
+        "order_by": [("freq", "desc")],
+        "limit": 50,
     },
     {
         "name": "count_how_many_users_vote_greather_than_4_a_couple_of_film",
@@ -155,6 +167,7 @@ QUERIES = [
             ORDER BY common_users DESC
         """,
         "params": (),
+        "order_by": [("common_users", "desc")],
     },
     {
 		"name": "movie_pairs_common_raters",
@@ -172,9 +185,38 @@ QUERIES = [
 			ORDER BY co_raters DESC;       
 		""",
 		"params": (),
+		"order_by": [("co_raters", "desc")],
 	}
 ]
 
+# ------------------------------
+# Varianti partizionate (scatter-gather) delle query pesanti sulle coppie.
+# - base: query monolitica di riferimento in QUERIES
+# - sql: sotto-query su un intervallo di userId (%s = lo, %s = hi), senza HAVING
+# - min_count: soglia HAVING applicata dopo il merge lato client
+# - order_by / limit: come in QUERIES
+# ------------------------------
+PARTITIONED_QUERIES = [
+    {
+        "name": "movie_pairs_common_raters_partitioned",
+        "base": "movie_pairs_common_raters",
+        "sql": """
+            SELECT
+                r1.movieId AS m1,
+                r2.movieId AS m2,
+                COUNT(*)   AS co_raters
+            FROM RATINGS r1
+            JOIN RATINGS r2
+              ON r1.userId  = r2.userId
+             AND r1.movieId < r2.movieId
+            WHERE r1.userId BETWEEN %s AND %s
+            GROUP BY m1, m2
+        """,
+        "min_count": 5,
+        "order_by": [("co_raters", "desc")],
+    }
+]
+
 indexes_mysql = {
     "MOVIE": [
         "CREATE INDEX idx_title ON MOVIE(title)"
@@ -193,46 +235,80 @@ indexes_mysql = {
 def apply_mysql_indexes(cursor,use_indexes):
     for table, stmts in indexes_mysql.items():
         for stmt in stmts:
-            if use_indexes:
-                cursor.execute(stmt)
-            else:
-                # Estraggo nome indice e tabella
-                parts = stmt.split()
-                if len(parts) >= 5 and parts[0].upper() == "CREATE" and parts[1].upper() == "INDEX":
-                    index_name = parts[2]
-                    table_name = parts[4].split("(")[0]
-
-                    # 🔎 Controllo se l’indice esiste
-                    cursor.execute(f"SHOW INDEX FROM {table_name}")
-                    existing_indexes = {row[2] for row in cursor.fetchall()}  # row[2] = Key_name
-
-                    if index_name in existing_indexes:
-                        drop_stmt = f"DROP INDEX {index_name} ON {table_name}"
-                        cursor.execute(drop_stmt)
-
-def run_query_times_and_last(cursor, sql, params, repeats, warmups):
+            # Estraggo nome indice e tabella
+            parts = stmt.split()
+            if len(parts) >= 5 and parts[0].upper() == "CREATE" and parts[1].upper() == "INDEX":
+                index_name = parts[2]
+                table_name = parts[4].split("(")[0]
+
+                # 🔎 Controllo se l’indice esiste (una run ripresa con --resume li trova già creati)
+                cursor.execute(f"SHOW INDEX FROM {table_name}")
+                existing_indexes = {row[2] for row in cursor.fetchall()}  # row[2] = Key_name
+
+                if use_indexes and index_name not in existing_indexes:
+                    cursor.execute(stmt)
+                elif not use_indexes and index_name in existing_indexes:
+                    drop_stmt = f"DROP INDEX {index_name} ON {table_name}"
+                    cursor.execute(drop_stmt)
+
+def run_query_times_and_last(cursor, sql, params, repeats, warmups, pids=None):
     for _ in range(warmups):
         cursor.execute(sql, params)
         cursor.fetchall()
 
-    times_ms, rows_last, header = [], [], []
+    times_ms, rows_last, header, resources = [], [], [], []
     for _ in range(repeats):
-        t0 = time.perf_counter()
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
-        t1 = time.perf_counter()
+        # telemetria di server e client campionata durante la run
+        with ResourceSampler(pids or {}) as sampler:
+            t0 = time.perf_counter()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            t1 = time.perf_counter()
         times_ms.append((t1 - t0) * 1000.0)
+        resources.append(sampler.result)
         rows_last = rows  # keep only the last run
         header = [col[0] for col in cursor.description] if cursor.description else []
-    return times_ms, rows_last, header
+    return times_ms, rows_last, header, resources
 
 
-def save_runs_csv(filename, times_ms):
+def run_partitioned_query(pool, sql, min_count, pids=None):
+    """Esegue una query partizionata per intervalli di userId sul pool di connessioni."""
+    conn = pool.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(userId), MAX(userId) FROM RATINGS")
+        lo, hi = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()  # restituisce la connessione al pool
+
+    def run_partition(p_lo, p_hi):
+        conn = pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, (p_lo, p_hi))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        finally:
+            conn.close()
+
+    ranges = user_ranges(lo, hi, PARTITIONS)
+    return run_partitioned_times_and_last(run_partition, ranges, min_count, REPEATS, WARMUP_RUNS, pids)
+
+
+def save_runs_csv(filename, times_ms, resources=None):
+    """CSV per-run; se presenti, aggiunge le colonne di telemetria (Telemetry.COLUMNS)."""
     with open(filename, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
-        w.writerow(["run", "time_ms"])
-        for i, t in enumerate(times_ms, 1):
-            w.writerow([i, t])
+        if resources is None:
+            w.writerow(["run", "time_ms"])
+            for i, t in enumerate(times_ms, 1):
+                w.writerow([i, t])
+        else:
+            w.writerow(["run", "time_ms", *TELEMETRY_COLUMNS])
+            for i, (t, res) in enumerate(zip(times_ms, resources), 1):
+                w.writerow([i, t, *(res.get(c, "") for c in TELEMETRY_COLUMNS)])
 
 def save_last_result_csv(path: Path, header, rows):
     with open(path, "w", newline="", encoding="utf-8") as f:
@@ -243,63 +319,75 @@ def save_last_result_csv(path: Path, header, rows):
             w.writerow(r)
 
 
-def append_summary_row(filename, row):
-    header = ["timestamp", "query_name", "runs", "avg_ms", "stdev_ms", "min_ms", "max_ms", "rows_last"]
-    write_header = False
-    try:
-        with open(filename, "r", encoding="utf-8"):
-            pass
-    except FileNotFoundError:
-        write_header = True
+def report_query(RESULTS_ROOT, ts, name, key, times_ms, rows_last, header, keys, resources=None):
+    """Stampa le statistiche di una query, salva i CSV e registra il checkpoint dell'unità."""
+    RESULTS_DIR = RESULTS_ROOT / "mysql"
+    avg = statistics.mean(times_ms)
+    stdev = statistics.stdev(times_ms) if len(times_ms) > 1 else 0.0
+    print("Execution times (ms):", [round(t, 2) for t in times_ms])
+    #print(f"Rows (last run): {rows_last}") # togliere commento per stampare l'ultima riga
+    print(f"Average: {avg:.2f} ms | StdDev: {stdev:.2f} ms | Min: {min(times_ms):.2f} ms | Max: {max(times_ms):.2f} ms")
 
-    with open(filename, "a", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        if write_header:
-            w.writerow(header)
-        w.writerow(row)
+    # CSV per-run e ultimo risultato
+    runs_file = RESULTS_DIR / f"{OUTPUT_PREFIX}_{name}.csv"
+    result_file = RESULTS_DIR / f"{name}.csv"
+    save_runs_csv(runs_file, times_ms, resources)
+    save_last_result_csv(result_file, header, rows_last)
+
+    # checkpoint dell'unità, poi summary ricostruito dai checkpoint
+    row = [ts, name, len(times_ms), f"{avg:.4f}", f"{stdev:.4f}", f"{min(times_ms):.4f}", f"{max(times_ms):.4f}", len(rows_last)]
+    save_checkpoint(RESULTS_ROOT, OUTPUT_PREFIX, name, key, row, [runs_file, result_file])
+    write_summary(RESULTS_ROOT, OUTPUT_PREFIX, keys, RESULTS_DIR / f"{OUTPUT_PREFIX}_summary.csv")
+    if rows_last:
+        print("Sample rows (up to 5):")
+        for r in rows_last[:5]:
+            print(r)
 
 # ------------------------------
 # Main benchmark
 # ------------------------------
-def mainMySql(RESULTS_ROOT,use_indexes):
+def mainMySql(RESULTS_ROOT,use_indexes,resume=False):
     try:
         conn = mysql.connector.connect(**CONFIG)
         # buffered evita problemi se in futuro iteri sui risultati
         cursor = conn.cursor(buffered=False)
         apply_mysql_indexes(cursor,use_indexes)
-        summary_file = RESULTS_ROOT / "mysql" / f"{OUTPUT_PREFIX}_summary.csv"      
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        RESULTS_DIR = RESULTS_ROOT / "mysql"
+        pool = None
+        pids = {"server": find_mysqld_pid(), "client": os.getpid()}
+        print(f"📈 Telemetry: mysqld pid={pids['server']}, client pid={pids['client']}")
+
+        # unità: (query, testo per la chiave, parametri per la chiave)
+        units = [(q, q["sql"], q.get("params", ())) for q in QUERIES]
+        units += [(q, q["sql"], {"min_count": q["min_count"], "partitions": PARTITIONS}) for q in PARTITIONED_QUERIES]
+        keys = {q["name"]: unit_key(OUTPUT_PREFIX, text, key_params, use_indexes) for q, text, key_params in units}
+        # unità modificate o incomplete: via il vecchio checkpoint e i suoi CSV prima di rieseguirle
+        discard_stale(RESULTS_ROOT, OUTPUT_PREFIX, keys)
+        # summary subito coerente: niente righe di unità scartate anche se la nuova esecuzione fallisce
+        write_summary(RESULTS_ROOT, OUTPUT_PREFIX, keys, RESULTS_ROOT / "mysql" / f"{OUTPUT_PREFIX}_summary.csv")
 
-        for q in QUERIES:
+        for q, text, key_params in units:
             name = q["name"]
-            sql = q["sql"]
-            params = q.get("params", ())
-
-            print(f"\n=== {name} ===")
-            times_ms, rows_last, header = run_query_times_and_last(cursor, sql, params, REPEATS, WARMUP_RUNS)
-
-            avg = statistics.mean(times_ms)
-            stdev = statistics.stdev(times_ms) if len(times_ms) > 1 else 0.0
-            print("Execution times (ms):", [round(t, 2) for t in times_ms])
-            #print(f"Rows (last run): {rows_last}") # togliere commento per stampare l'ultima riga
-            print(f"Average: {avg:.2f} ms | StdDev: {stdev:.2f} ms | Min: {min(times_ms):.2f} ms | Max: {max(times_ms):.2f} ms")
-
-            # CSV per-run
-            runs_file = RESULTS_ROOT / "mysql" / f"{OUTPUT_PREFIX}_{name}.csv"
-            save_runs_csv(runs_file, times_ms)
-            save_last_result_csv(RESULTS_DIR / f"{name}.csv", header, rows_last)
-
-            # CSV summary cumulativo
-            append_summary_row(
-                summary_file,
-                [ts, name, len(times_ms), f"{avg:.4f}", f"{stdev:.4f}", f"{min(times_ms):.4f}", f"{max(times_ms):.4f}", len(rows_last)],
-            )
-            if rows_last:
-                print("Sample rows (up to 5):")
-                for r in rows_last[:5]:
-                    print(r)
+            key = keys[name]
+            if resume and is_done(RESULTS_ROOT, OUTPUT_PREFIX, name, key):
+                print(f"\n=== {name} === già completata, salto (--resume)")
+                continue
 
+            # un errore su una query non butta via le altre: l'unità resta senza checkpoint
+            try:
+                if "base" in q:
+                    # variante partizionata, riportata accanto alla versione monolitica
+                    if pool is None:
+                        pool = pooling.MySQLConnectionPool(pool_name="bench", pool_size=PARTITIONS, **CONFIG)
+                    print(f"\n=== {name} ({PARTITIONS} partitions, base: {q['base']}) ===")
+                    times_ms, rows_last, header, resources = run_partitioned_query(pool, q["sql"], q["min_count"], pids)
+                else:
+                    print(f"\n=== {name} ===")
+                    times_ms, rows_last, header, resources = run_query_times_and_last(cursor, q["sql"], q.get("params", ()), REPEATS, WARMUP_RUNS, pids)
+                report_query(RESULTS_ROOT, ts, name, key, times_ms, rows_last, header, keys, resources)
+            except Exception as e:
+                print(f"Errore su {name}:", e)
+                traceback.print_exc()
 
         cursor.close()
         conn.close()
@@ -5,7 +5,10 @@ import statistics
 import csv
 from datetime import datetime
 import os
-import sys
+import traceback
+from Partitioned import PARTITIONS, user_ranges, run_partitioned_times_and_last
+from Checkpoint import unit_key, is_done, discard_stale, save_checkpoint, write_summary
+from Telemetry import ResourceSampler, COLUMNS as TELEMETRY_COLUMNS, find_neo4j_pid
 # Connection config (adatta user/password/uri e nome database)
 neo4j_config = {
     "uri": "bolt://localhost:7687",
@@ -97,6 +100,24 @@ QUERIES = [
 	}
 ]
 
+# Varianti partizionate (scatter-gather): una sotto-query per intervallo di userId,
+# senza soglia; min_count viene applicato dopo il merge lato client.
+PARTITIONED_QUERIES = [
+    {
+        "name": "movie_pairs_common_raters_partitioned",
+        "base": "movie_pairs_common_raters",
+        "cypher": """
+            MATCH (u:User)
+            WHERE u.userId >= $lo AND u.userId <= $hi
+            MATCH (u)-[:RATED]->(m1:Movie),
+                  (u)-[:RATED]->(m2:Movie)
+            WHERE m1.movieId < m2.movieId
+            RETURN m1.movieId AS m1, m2.movieId AS m2, count(*) AS co_raters
+        """,
+        "min_count": 5,
+    }
+]
+
 indexes_neo4j = {
     "Movie": [
         "CREATE INDEX movie_id_index FOR (m:Movie) ON (m.movieId)",
@@ -118,8 +139,9 @@ def apply_neo4j_indexes(session,use_indexes):
     for _, stmts in indexes_neo4j.items():
         for stmt in stmts:
             if use_indexes:
-                # Eseguo CREATE INDEX
-                session.run(stmt)
+                # Eseguo CREATE INDEX (IF NOT EXISTS: una run ripresa con --resume li trova già creati)
+                parts = stmt.split()
+                session.run(" ".join(parts[:3] + ["IF NOT EXISTS"] + parts[3:]))
             else:
                 # Estraggo il nome dell’indice per generare DROP
                 parts = stmt.split()
@@ -129,28 +151,53 @@ def apply_neo4j_indexes(session,use_indexes):
                     drop_stmt = f"DROP INDEX {index_name} IF EXISTS"
                     session.run(drop_stmt)
 
-def run_query_times_and_last(session, cypher, params, repeats, warmups):
+def run_query_times_and_last(session, cypher, params, repeats, warmups, pids=None):
     for _ in range(warmups):
         session.run(cypher, params).consume()
 
-    times_ms, rows_last, header = [], [], []
+    times_ms, rows_last, header, resources = [], [], [], []
     for _ in range(repeats):
-        t0 = time.perf_counter()
-        res = session.run(cypher, params)
-        data = list(res)
-        t1 = time.perf_counter()
+        # telemetria di server (JVM) e client campionata durante la run
+        with ResourceSampler(pids or {}) as sampler:
+            t0 = time.perf_counter()
+            res = session.run(cypher, params)
+            data = list(res)
+            t1 = time.perf_counter()
         times_ms.append((t1 - t0) * 1000.0)
+        resources.append(sampler.result)
         rows_last = [tuple(r.values()) for r in data]
         header = list(data[0].keys()) if data else []
-    return times_ms, rows_last, header
+    return times_ms, rows_last, header, resources
+
+
+def run_partitioned_query(driver, cypher, min_count, pids=None):
+    """Esegue una query partizionata per intervalli di userId, una sessione per partizione."""
+    database = neo4j_config["database"]
+    with driver.session(database=database) as session:
+        rec = session.run("MATCH (u:User) RETURN min(u.userId) AS lo, max(u.userId) AS hi").single()
+        lo, hi = rec["lo"], rec["hi"]
 
+    def run_partition(p_lo, p_hi):
+        # le sessioni non sono thread-safe: ogni partizione apre la propria
+        with driver.session(database=database) as session:
+            return [tuple(r.values()) for r in session.run(cypher, {"lo": p_lo, "hi": p_hi})]
 
-def save_runs_csv(filename, times_ms):
+    ranges = user_ranges(lo, hi, PARTITIONS)
+    return run_partitioned_times_and_last(run_partition, ranges, min_count, REPEATS, WARMUP_RUNS, pids)
+
+
+def save_runs_csv(filename, times_ms, resources=None):
+    """CSV per-run; se presenti, aggiunge le colonne di telemetria (Telemetry.COLUMNS)."""
     with open(filename, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
-        w.writerow(["run", "time_ms"])
-        for i, t in enumerate(times_ms, 1):
-            w.writerow([i, t])
+        if resources is None:
+            w.writerow(["run", "time_ms"])
+            for i, t in enumerate(times_ms, 1):
+                w.writerow([i, t])
+        else:
+            w.writerow(["run", "time_ms", *TELEMETRY_COLUMNS])
+            for i, (t, res) in enumerate(zip(times_ms, resources), 1):
+                w.writerow([i, t, *(res.get(c, "") for c in TELEMETRY_COLUMNS)])
 
 def save_last_result_csv(path: Path, header, rows):
     path.parent.mkdir(parents=True, exist_ok=True)
@@ -161,54 +208,73 @@ def save_last_result_csv(path: Path, header, rows):
         for r in rows:
             w.writerow(r)
 
-def append_summary_row(filename, row):
-    header = ["timestamp", "query_name", "runs", "avg_ms", "stdev_ms", "min_ms", "max_ms", "rows_last"]
-    write_header = not os.path.exists(filename)
-    with open(filename, "a", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        if write_header:
-            w.writerow(header)
-        w.writerow(row)
+def report_query(RESULTS_ROOT, ts, name, key, times_ms, rows_last, header, keys, resources=None):
+    """Stampa le statistiche di una query, salva i CSV e registra il checkpoint dell'unità."""
+    RESULTS_DIR = RESULTS_ROOT / "neo4j"
+    avg = statistics.mean(times_ms)
+    stdev = statistics.stdev(times_ms) if len(times_ms) > 1 else 0.0
+    print("Times (ms):", [round(t, 2) for t in times_ms])
+    #print(f"Rows (last run): {rows_last}")
+    print(f"Average: {avg:.2f} ms | StdDev: {stdev:.2f} ms | Min: {min(times_ms):.2f} ms | Max: {max(times_ms):.2f} ms")
 
-def mainNeo4j(RESULTS_ROOT,use_indexes):
+    runs_file = RESULTS_DIR / f"{OUTPUT_PREFIX}_{name}.csv"
+    result_file = RESULTS_DIR / f"{name}.csv"
+    save_runs_csv(runs_file, times_ms, resources)
+    save_last_result_csv(result_file, header, rows_last)
+
+    row = [ts, name, len(times_ms), f"{avg:.4f}", f"{stdev:.4f}", f"{min(times_ms):.4f}", f"{max(times_ms):.4f}", len(rows_last)]
+    save_checkpoint(RESULTS_ROOT, OUTPUT_PREFIX, name, key, row, [runs_file, result_file])
+    write_summary(RESULTS_ROOT, OUTPUT_PREFIX, keys, RESULTS_DIR / f"{OUTPUT_PREFIX}_summary.csv")
+    if rows_last:
+        print("Sample rows (up to 5):")
+        for r in rows_last[:5]:
+            print(r)
+
+def mainNeo4j(RESULTS_ROOT,use_indexes,resume=False):
     try:
         driver = GraphDatabase.driver(neo4j_config["uri"], auth=neo4j_config["auth"])
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        RESULTS_DIR = RESULTS_ROOT / "neo4j"
-        summary_file = RESULTS_DIR/ f"{OUTPUT_PREFIX}_summary.csv"
+        pids = {"server": find_neo4j_pid(), "client": os.getpid()}
+        print(f"📈 Telemetry: neo4j pid={pids['server']}, client pid={pids['client']}")
+
+        # unità: (query, testo per la chiave, parametri per la chiave)
+        units = [(q, q["cypher"], q.get("params", {})) for q in QUERIES]
+        units += [(q, q["cypher"], {"min_count": q["min_count"], "partitions": PARTITIONS}) for q in PARTITIONED_QUERIES]
+        keys = {q["name"]: unit_key(OUTPUT_PREFIX, text, key_params, use_indexes) for q, text, key_params in units}
+        # unità modificate o incomplete: via il vecchio checkpoint e i suoi CSV prima di rieseguirle
+        discard_stale(RESULTS_ROOT, OUTPUT_PREFIX, keys)
+        # summary subito coerente: niente righe di unità scartate anche se la nuova esecuzione fallisce
+        write_summary(RESULTS_ROOT, OUTPUT_PREFIX, keys, RESULTS_ROOT / "neo4j" / f"{OUTPUT_PREFIX}_summary.csv")
 
         with driver.session(database=neo4j_config["database"]) as session:
             apply_neo4j_indexes(session,use_indexes)
-            for q in QUERIES:
+            for q, text, key_params in units:
                 name = q["name"]
-                cypher = q["cypher"]
-                params = q.get("params", {})
-
-                times_ms, rows_last, header = run_query_times_and_last(session, cypher, params, REPEATS, WARMUP_RUNS)
-                avg = statistics.mean(times_ms)
-                stdev = statistics.stdev(times_ms) if len(times_ms) > 1 else 0.0
-
-                print(f"\n=== {name} ===")
-                print("Times (ms):", [round(t, 2) for t in times_ms])
-                #print(f"Rows (last run): {rows_last}")
-                print(f"Average: {avg:.2f} ms | StdDev: {stdev:.2f} ms | Min: {min(times_ms):.2f} ms | Max: {max(times_ms):.2f} ms")
-
-                save_runs_csv(RESULTS_ROOT / "neo4j" / f"{OUTPUT_PREFIX}_{name}.csv", times_ms)
-                save_last_result_csv(RESULTS_DIR / f"{name}.csv", header, rows_last)
-                append_summary_row(
-                    summary_file,
-                    [ts, name, len(times_ms), f"{avg:.4f}", f"{stdev:.4f}", f"{min(times_ms):.4f}", f"{max(times_ms):.4f}", len(rows_last)],
-                )
-                if rows_last:
-                    print("Sample rows (up to 5):")
-                    for r in rows_last[:5]:
-                        print(r)
+                key = keys[name]
+                if resume and is_done(RESULTS_ROOT, OUTPUT_PREFIX, name, key):
+                    print(f"\n=== {name} === already completed, skipping (--resume)")
+                    continue
+
+                # un errore su una query non butta via le altre: l'unità resta senza checkpoint
+                try:
+                    if "base" in q:
+                        # variante partizionata, riportata accanto alla versione monolitica
+                        times_ms, rows_last, header, resources = run_partitioned_query(driver, q["cypher"], q["min_count"], pids)
+                        print(f"\n=== {name} ({PARTITIONS} partitions, base: {q['base']}) ===")
+                    else:
+                        times_ms, rows_last, header, resources = run_query_times_and_last(session, q["cypher"], q.get("params", {}), REPEATS, WARMUP_RUNS, pids)
+                        print(f"\n=== {name} ===")
+                    report_query(RESULTS_ROOT, ts, name, key, times_ms, rows_last, header, keys, resources)
+                except Exception as e:
+                    print(f"Neo4j error on {name}:", e)
+                    traceback.print_exc()
 
         driver.close()
         print("\nBenchmark completed. CSV files written to the current directory.")
     except Exception as e:
+        # come mainMySql: i risultati già salvati restano confrontabili da Application
         print("Neo4j error:", e)
-        sys.exit(1)
+        traceback.print_exc()
 
 if __name__ == "__main__":
     mainNeo4j()
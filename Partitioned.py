@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Telemetry import ResourceSampler
+
+# ------------------------------
+# Esecuzione partizionata (scatter-gather) delle query sulle coppie di film.
+# Il workload viene diviso per intervalli di userId: ogni coppia (m1, m2) di
+# un utente cade in una sola partizione, quindi i conteggi parziali si possono
+# sommare lato client e la soglia HAVING va applicata solo dopo il merge.
+# ------------------------------
+PARTITIONS = 8  # numero di sotto-query (e di connessioni nel pool)
+
+
+def user_ranges(lo, hi, n):
+    """Divide [lo, hi] in al più n intervalli chiusi contigui."""
+    if lo is None or hi is None:
+        return []
+    lo, hi = int(lo), int(hi)
+    n = max(1, min(n, hi - lo + 1))
+    bounds = np.linspace(lo, hi + 1, n + 1).astype(np.int64)
+    return [(int(bounds[i]), int(bounds[i + 1]) - 1) for i in range(n) if bounds[i + 1] > bounds[i]]
+
+
+def rows_to_arrays(rows):
+    """Converte le righe (m1, m2, count) di una partizione in array NumPy compatti."""
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.copy(), empty.copy()
+    arr = np.asarray(rows, dtype=np.int64)
+    return arr[:, 0], arr[:, 1], arr[:, 2]
+
+
+def merge_pair_counts(partials, min_count):
+    """
+    Somma i conteggi parziali (m1, m2) -> count e applica la soglia HAVING.
+    Le chiavi sono impacchettate in un int64 (m1 << 32 | m2): ordinamento +
+    np.add.reduceat al posto di un dict di tuple.
+    Ritorna le righe (m1, m2, count) ordinate per count decrescente.
+    """
+    partials = [p for p in partials if len(p[0])]
+    if not partials:
+        return []
+    m1 = np.concatenate([p[0] for p in partials])
+    m2 = np.concatenate([p[1] for p in partials])
+    counts = np.concatenate([p[2] for p in partials])
+
+    keys = (m1 << 32) | m2
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    counts = counts[order]
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    totals = np.add.reduceat(counts, starts)
+    keys = keys[starts]
+
+    keep = totals >= min_count
+    keys, totals = keys[keep], totals[keep]
+    order = np.argsort(-totals, kind="stable")
+    keys, totals = keys[order], totals[order]
+    return list(zip((keys >> 32).tolist(), (keys & 0xFFFFFFFF).tolist(), totals.tolist()))
+
+
+def run_partitioned_times_and_last(run_partition, ranges, min_count, repeats, warmups, pids=None):
+    """
+    Esegue le sotto-query in parallelo (una per intervallo) e fa il merge.
+    run_partition(lo, hi) deve ritornare le righe (m1, m2, count) della partizione
+    ed essere sicura da chiamare da thread diversi (una connessione/sessione per chiamata).
+    pids: processi da campionare durante ogni run ({label: pid}, vedi Telemetry).
+    """
+    def run_once(pool):
+        partials = pool.map(lambda r: rows_to_arrays(run_partition(*r)), ranges)
+        return merge_pair_counts(list(partials), min_count)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(ranges))) as pool:
+        for _ in range(warmups):
+            run_once(pool)
+
+        times_ms, rows_last, resources = [], [], []
+        for _ in range(repeats):
+            with ResourceSampler(pids or {}) as sampler:
+                t0 = time.perf_counter()
+                rows = run_once(pool)
+                t1 = time.perf_counter()
+            times_ms.append((t1 - t0) * 1000.0)
+            resources.append(sampler.result)
+            rows_last = rows  # keep only the last run
+    return times_ms, rows_last, ["m1", "m2", "co_raters"], resources
@@ -0,0 +1,188 @@
+import os
+import threading
+
+# ------------------------------
+# Telemetria di risorse durante ogni run misurata.
+# Un thread in background legge /proc per il processo server (mysqld o la JVM
+# di Neo4j) e per il client Python: CPU time, RSS, byte letti/scritti e context
+# switch. Per ogni run si salvano i delta (fine - inizio) e il picco di RSS.
+# Su sistemi senza /proc o con il server in un container/host diverso le
+# colonne restano vuote.
+# Il campionamento periodico legge solo l'RSS (per il picco); CPU, I/O e
+# context switch per thread si leggono solo a inizio e fine run. Il lavoro del
+# thread di campionamento viene sottratto dalle colonne del client.
+# ------------------------------
+ENABLED = True  # False per run di solo timing: nessun thread, colonne vuote
+SAMPLE_INTERVAL_S = 0.05
+LABELS = ["server", "client"]
+METRICS = ["cpu_ms", "rss_peak_kb", "read_bytes", "write_bytes", "ctx_switches"]
+COLUMNS = [f"{label}_{metric}" for label in LABELS for metric in METRICS]
+
+try:
+    _CLK_TCK = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    _CLK_TCK = 100
+
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def find_pid(match):
+    """Primo pid in /proc per cui match(comm, cmdline) è vero, altrimenti None."""
+    if not os.path.isdir("/proc"):
+        return None
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        comm = (_read(f"/proc/{entry}/comm") or "").strip()
+        cmdline = (_read(f"/proc/{entry}/cmdline") or "").replace("\0", " ")
+        if match(comm, cmdline):
+            return int(entry)
+    return None
+
+
+def find_mysqld_pid():
+    return find_pid(lambda comm, cmdline: comm == "mysqld")
+
+
+def find_neo4j_pid():
+    return find_pid(lambda comm, cmdline: comm == "java" and "neo4j" in cmdline.lower())
+
+
+def _ctx_switches(pid):
+    """
+    Context switch per thread ({tid: voluntary + nonvoluntary}). In
+    /proc/<pid>/status i contatori riguardano solo il thread principale,
+    mentre mysqld, la JVM e il client partizionato lavorano su thread worker.
+    """
+    try:
+        tids = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return {}
+    ctx = {}
+    for tid in tids:
+        for line in (_read(f"/proc/{pid}/task/{tid}/status") or "").splitlines():
+            key, _, value = line.partition(":")
+            if key in ("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches"):
+                ctx[tid] = ctx.get(tid, 0) + int(value)
+    return ctx
+
+
+def _cpu_ms(stat):
+    """utime + stime (ms) da un file stat di /proc."""
+    # il campo comm può contenere spazi: si riparte dopo l'ultima ')'
+    fields = stat[stat.rfind(")") + 2:].split()
+    return (int(fields[11]) + int(fields[12])) * 1000.0 / _CLK_TCK
+
+
+def read_rss_kb(pid):
+    for line in (_read(f"/proc/{pid}/status") or "").splitlines():
+        key, _, value = line.partition(":")
+        if key == "VmRSS":
+            return int(value.split()[0])
+    return None
+
+
+def read_thread(tid):
+    """CPU time (ms) e context switch di un thread del processo corrente (None se non leggibile)."""
+    stat = _read(f"/proc/self/task/{tid}/stat")
+    if stat is None:
+        return None
+    snap = {"cpu_ms": _cpu_ms(stat), "ctx_switches": 0}
+    for line in (_read(f"/proc/self/task/{tid}/status") or "").splitlines():
+        key, _, value = line.partition(":")
+        if key in ("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches"):
+            snap["ctx_switches"] += int(value)
+    return snap
+
+
+def read_proc(pid):
+    """Istantanea delle risorse di un processo (None se non leggibile)."""
+    stat = _read(f"/proc/{pid}/stat")
+    if stat is None:
+        return None
+    snap = {"cpu_ms": _cpu_ms(stat)}
+    rss = read_rss_kb(pid)
+    if rss is not None:
+        snap["rss_kb"] = rss
+    snap["ctx_switches"] = _ctx_switches(pid)
+
+    # /proc/<pid>/io richiede di essere lo stesso utente (o root)
+    io = _read(f"/proc/{pid}/io") or ""
+    for line in io.splitlines():
+        key, _, value = line.partition(":")
+        if key in ("read_bytes", "write_bytes"):
+            snap[key] = int(value)
+    return snap
+
+
+class ResourceSampler(threading.Thread):
+    """
+    Campiona i processi in pids ({label: pid}) finché il blocco with è attivo.
+    Dopo l'uscita, result contiene una colonna per ogni voce di COLUMNS.
+    """
+
+    def __init__(self, pids, interval=SAMPLE_INTERVAL_S):
+        super().__init__(daemon=True)
+        self.pids = {label: pid for label, pid in pids.items() if pid is not None}
+        self.interval = interval
+        self.result = {}
+        self._stop_event = threading.Event()
+        self._start_snaps = {}
+        self._peak_rss = {}
+        self._own_tid = None
+        self._own_start = None
+        self._own_end = None
+
+    def _sample_rss(self):
+        for label, pid in self.pids.items():
+            rss = read_rss_kb(pid)
+            if rss is not None:
+                self._peak_rss[label] = max(self._peak_rss.get(label, 0), rss)
+
+    def run(self):
+        self._own_tid = threading.get_native_id()
+        self._own_start = read_thread(self._own_tid)
+        while not self._stop_event.wait(self.interval):
+            self._sample_rss()
+        self._own_end = read_thread(self._own_tid)
+
+    def __enter__(self):
+        if not ENABLED:
+            return self
+        self._start_snaps = {label: read_proc(pid) for label, pid in self.pids.items()}
+        self._sample_rss()
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.result = {col: "" for col in COLUMNS}
+        if not ENABLED:
+            return False
+        self._stop_event.set()
+        self.join()
+        self._sample_rss()
+        for label, pid in self.pids.items():
+            start, end = self._start_snaps.get(label), read_proc(pid)
+            if start is None or end is None:
+                continue
+            for metric in ("cpu_ms", "read_bytes", "write_bytes"):
+                if metric in start and metric in end:
+                    self.result[f"{label}_{metric}"] = end[metric] - start[metric]
+            # somma per thread: i thread nati durante la run partono da 0; quelli
+            # terminati prima della fine non contano (i pool tengono vivi i worker)
+            start_ctx = start["ctx_switches"]
+            ctx = {tid: n - start_ctx.get(tid, 0) for tid, n in end["ctx_switches"].items()}
+            if pid == os.getpid() and self._own_start and self._own_end:
+                # il thread di campionamento è già terminato: resta solo la sua CPU
+                ctx.pop(str(self._own_tid), None)
+                self.result[f"{label}_cpu_ms"] -= self._own_end["cpu_ms"] - self._own_start["cpu_ms"]
+            self.result[f"{label}_ctx_switches"] = sum(ctx.values())
+            if label in self._peak_rss:
+                self.result[f"{label}_rss_peak_kb"] = self._peak_rss[label]
+        return False